@@ -2,13 +2,22 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import altair as alt
+import numba
+import polars as pl
 import os
+import hashlib
+from scipy.linalg.blas import get_blas_funcs
 
 st.set_page_config(layout="wide", page_title="타이타닉 데이터 상관관계 분석 (XLSX)")
 
 # 분석에 사용할 표준화된 열 이름 정의 (모두 소문자로 통일)
 STANDARD_COLS = ['pclass', 'age', 'sibsp', 'parch', 'fare']
 
+# 산점도에 전달할 최대 데이터 포인트 수 (브라우저로 전송되는 JSON 크기 제한)
+# VegaFusion 변환기는 사용하지 않음: 활성화하면 Vega-Lite 명세(to_dict)를 만들 수 없어
+# 세션에 보관한 명세를 st.vega_lite_chart로 그릴 수 없고, 데이터는 이미 서버에서 표본 추출됨
+SCATTER_MAX_POINTS = 2000
+
 def find_data_file():
     """현재 디렉토리에서 첫 번째 XLSX 파일을 찾습니다."""
     for filename in os.listdir('.'):
@@ -21,20 +30,20 @@ def find_data_file():
 def load_and_preprocess_data(file_path):
     """
     XLSX 파일을 로드하고, 열 이름 정규화, 숫자 변환, 결측치 처리를 수행합니다.
-    (pd.read_csv 대신 pd.read_excel 사용)
+    (Polars로 로드 및 전처리한 뒤, 마지막에만 pandas DataFrame으로 변환)
     """
     try:
-        # 엑셀 파일 로드 (첫 번째 시트(sheet_name=0) 사용)
-        df = pd.read_excel(file_path, sheet_name=0)
+        # 엑셀 파일 로드 (첫 번째 시트(sheet_id=1) 사용, Rust 기반 calamine 엔진)
+        df = pl.read_excel(file_path, sheet_id=1, engine='calamine')
     except FileNotFoundError:
         st.error(f"❌ 오류: 데이터 파일 '{file_path}'을(를) 찾을 수 없습니다.")
         return None
     except Exception as e:
-        st.error(f"❌ 오류: Excel 파일 로드 중 문제가 발생했습니다. (오픈파이엑셀 라이브러리가 설치되었는지 확인하세요: {e})")
+        st.error(f"❌ 오류: Excel 파일 로드 중 문제가 발생했습니다. (fastexcel 라이브러리가 설치되었는지 확인하세요: {e})")
         return None
     
     # 1. 열 이름 정규화: 소문자로 변환하고 공백 제거 (유연성 확보)
-    df.columns = df.columns.str.lower().str.replace(' ', '', regex=False)
+    df = df.rename({col: col.lower().replace(' ', '') for col in df.columns})
     
     # 2. 'sex' (성별) 열 찾기 및 숫자 변환
     sex_col_name = None
@@ -44,8 +53,14 @@ def load_and_preprocess_data(file_path):
             break
             
     if sex_col_name:
-        df['sex_numeric'] = df[sex_col_name].astype(str).str.lower().map({'female': 1, 'male': 0})
-        df['sex_numeric'].fillna(df['sex_numeric'].median(), inplace=True)
+        # female=1, male=0, 그 외 값은 null로 두고 아래에서 중앙값으로 채움
+        sex = pl.col(sex_col_name).cast(pl.String).str.to_lowercase()
+        df = df.with_columns(
+            pl.when(sex == 'female').then(1)
+            .when(sex == 'male').then(0)
+            .otherwise(None)
+            .alias('sex_numeric')
+        )
     else:
         st.warning("⚠️ 경고: 'sex' 또는 'gender' 열을 찾을 수 없어 성별 분석은 제외됩니다.")
 
@@ -57,60 +72,149 @@ def load_and_preprocess_data(file_path):
     if not numeric_analysis_cols:
         st.error("❌ 오류: 분석에 사용할 유효한 숫자형 데이터 열 (pclass, age, fare 등)을 찾을 수 없습니다.")
         return None
-            
-    processed_df = df[numeric_analysis_cols].copy()
     
-    for col in processed_df.columns:
-        processed_df[col] = pd.to_numeric(processed_df[col], errors='coerce')
-        median_val = processed_df[col].median()
-        if not pd.isna(median_val):
-            processed_df[col].fillna(median_val, inplace=True)
-        else:
-            processed_df.drop(columns=[col], inplace=True)
-            st.warning(f"⚠️ 경고: '{col}' 열의 모든 값이 비어 있거나 숫자가 아니어서 분석에서 제외됩니다.")
+    # 숫자로 변환할 수 없는 값은 null 처리
+    # (표시 정밀도는 소수점 4자리이므로 float32로 충분하며 메모리 대역폭이 절반으로 줄어듦)
+    processed_df = df.select(pl.col(numeric_analysis_cols).cast(pl.Float32, strict=False))
+    
+    # 모든 값이 비어 있는 열은 제외하고, 나머지 열의 결측치는 중앙값으로 한 번에 채움
+    empty_cols = [col for col in processed_df.columns if processed_df[col].null_count() == processed_df.height]
+    for col in empty_cols:
+        st.warning(f"⚠️ 경고: '{col}' 열의 모든 값이 비어 있거나 숫자가 아니어서 분석에서 제외됩니다.")
+    processed_df = processed_df.drop(empty_cols)
+    processed_df = processed_df.with_columns(pl.all().fill_null(pl.all().median()).cast(pl.Float32))
 
-    return processed_df
+    # 이후 단계(상관관계, 차트, 표시)는 pandas를 사용하므로 float32 배열 그대로 넘김
+    values = processed_df.to_numpy()
+    result_df = pd.DataFrame(values, columns=processed_df.columns)
+    # 세션에 보관한 상관관계/차트를 무효화하기 위한 데이터 지문 (로드 시 한 번만 계산되어 함께 캐시됨)
+    result_df.attrs['data_key'] = hashlib.sha1(
+        repr(processed_df.columns).encode() + np.ascontiguousarray(values).tobytes()
+    ).hexdigest()
+    return result_df
 
 # --- 나머지 함수들 (calculate_correlation, get_extreme_correlations, create_scatterplot, create_heatmap) ---
 # [NOTE: 코드가 너무 길어지므로 함수 정의부는 생략하고 본문만 제공합니다. 이전 답변의 함수 정의를 그대로 사용하세요. 문법 오류는 수정되어 있습니다.]
 
+# Streamlit은 스크립트를 작업자 스레드에서 실행하므로 parallel=True(스레딩 레이어)는 사용하지 않음
+@numba.njit(fastmath={'reassoc', 'contract'}, cache=True)
+def _standardize_columns(X):
+    """
+    각 열을 평균 0, 표준편차 1로 표준화하여 (열 개수 x 행 개수) 배열로 반환합니다.
+    (연속된 열 데이터를 두 번 순회하며 평균과 편차 제곱합을 float64로 계산)
+    """
+    n, k = X.shape
+    Z = np.empty((k, n), dtype=X.dtype)
+    if n < 2:
+        Z[:, :] = np.nan
+        return Z
+    for j in range(k):
+        total = 0.0
+        for i in range(n):
+            total += np.float64(X[i, j])
+        mean = total / n
+        # 평균을 뺀 뒤 제곱하여 합산 (큰 평균값에서의 상쇄 오차 방지)
+        sum_sq = 0.0
+        is_constant = True
+        for i in range(n):
+            d = np.float64(X[i, j]) - mean
+            sum_sq += d * d
+            if X[i, j] != X[0, j]:
+                is_constant = False
+        if is_constant:
+            # 값이 모두 같은 열은 np.corrcoef와 동일하게 NaN으로 처리
+            Z[j, :] = np.nan
+            continue
+        inv_std = 1.0 / np.sqrt(sum_sq / (n - 1))
+        for i in range(n):
+            Z[j, i] = (np.float64(X[i, j]) - mean) * inv_std
+    return Z
+
+@st.cache_data
 def calculate_correlation(df):
-    """데이터프레임의 상관관계 행렬을 계산합니다."""
-    return df.corr()
+    """데이터프레임의 상관관계 행렬을 계산합니다. (표준화 후 행렬 곱 한 번으로 계산)"""
+    # 열 단위로 연속된 메모리를 읽도록 Fortran 순서 배열로 전달 (이미 그렇다면 복사 없음)
+    X = np.asfortranarray(df.to_numpy(dtype=np.float32))
+    n = X.shape[0]
+    if n < 2:
+        # 데이터 행이 2개 미만이면 상관계수를 정의할 수 없음 (df.corr()와 동일하게 NaN)
+        return pd.DataFrame(np.nan, index=df.columns, columns=df.columns, dtype=np.float32)
+    Z = _standardize_columns(X)
+    # 대칭 행렬이므로 GEMM 대신 SYRK로 상삼각만 계산 (연산량 절반)
+    # Z.T는 Fortran 순서이므로 BLAS 호출 시 복사가 일어나지 않음
+    syrk = get_blas_funcs('syrk', (Z,))
+    corr = syrk(alpha=1.0 / (n - 1), a=Z.T, trans=1, lower=0)
+    corr += np.triu(corr, k=1).T
+    np.clip(corr, -1, 1, out=corr)
+    return pd.DataFrame(corr, index=df.columns, columns=df.columns)
 
-def get_extreme_correlations(corr_matrix, is_positive=True):
-    """가장 높은 양의/음의 상관관계를 가진 쌍을 찾습니다."""
-    
-    corr_unstacked = corr_matrix.unstack()
-    
-    pairs = corr_unstacked[corr_unstacked.index.get_level_values(0) != corr_unstacked.index.get_level_values(1)]
+@numba.njit(cache=True)
+def _find_extreme_pair(mat, positive):
+    """상삼각 행렬을 한 번 순회하며 가장 큰 양의/가장 작은 음의 값의 위치를 찾습니다."""
+    # 0에서 시작하므로 양수(또는 음수)인 값만 선택되며, NaN은 비교에서 자동으로 제외됨
+    best = 0.0
+    best_i = -1
+    best_j = -1
+    n = mat.shape[0]
+    for i in range(n):
+        for j in range(i + 1, n):
+            v = mat[i, j]
+            if (positive and v > best) or (not positive and v < best):
+                best = v
+                best_i = i
+                best_j = j
+    return best_i, best_j, best
+
+@st.cache_data
+def get_extreme_correlations(corr_values, columns, is_positive=True):
+    """
+    가장 높은 양의/음의 상관관계를 가진 쌍을 찾습니다. (상삼각 행렬만 탐색)
+    (캐시 키 해싱 비용을 줄이기 위해 DataFrame 대신 ndarray와 열 이름 튜플을 받음)
+    """
     
-    if is_positive:
-        result = pairs[pairs > 0].nlargest(1)
-    else:
-        result = pairs[pairs < 0].nsmallest(1)
+    i, j, corr_value = _find_extreme_pair(corr_values, is_positive)
     
-    if result.empty:
+    if i < 0:
         return None, None, None
         
-    (var1, var2), corr_value = result.index[0], result.iloc[0]
-    return var1, var2, corr_value
+    return columns[i], columns[j], float(corr_value)
 
 def create_scatterplot(df, var1, var2, corr_value):
-    """두 변수 간의 산점도를 생성합니다."""
-    chart = alt.Chart(df).mark_point().encode(
+    """두 변수 간의 산점도를 생성합니다. (최대 SCATTER_MAX_POINTS개로 표본 추출)"""
+    plot_df = df[[var1, var2]]
+    if len(plot_df) > SCATTER_MAX_POINTS:
+        plot_df = plot_df.sample(n=SCATTER_MAX_POINTS, random_state=0)
+    
+    chart = alt.Chart(plot_df).mark_point().encode(
         x=alt.X(var1, title=var1),
         y=alt.Y(var2, title=var2),
         tooltip=[var1, var2]
     ).properties(
         title=f'{var1} vs {var2} 산점도 (R={corr_value:.3f})'
-    ).interactive()
+    ).add_params(
+        # x/y 축 스케일에만 확대/이동을 연결
+        alt.selection_interval(bind='scales', encodings=['x', 'y'])
+    )
     return chart
 
+def get_scatterplot_spec(df, var1, var2, corr_value):
+    """산점도의 Vega-Lite 명세를 세션 상태에 보관하여 재실행 시 다시 직렬화하지 않습니다."""
+    specs = st.session_state.setdefault('scatter_specs', {})
+    if (var1, var2) not in specs:
+        specs[(var1, var2)] = create_scatterplot(df, var1, var2, corr_value).to_dict()
+    return specs[(var1, var2)]
+
+@st.cache_data
 def create_heatmap(corr_df):
     """상관관계 행렬 히트맵을 생성합니다."""
-    corr_data = corr_df.stack().reset_index()
-    corr_data.columns = ['Variable 1', 'Variable 2', 'Correlation']
+    # stack()/reset_index() 대신 NumPy로 바로 long-form 데이터 구성
+    cols = corr_df.columns.to_numpy()
+    col_grid, row_grid = np.meshgrid(cols, cols)
+    corr_data = pd.DataFrame({
+        'Variable 1': row_grid.ravel(),
+        'Variable 2': col_grid.ravel(),
+        'Correlation': corr_df.to_numpy().ravel()
+    })
     
     base = alt.Chart(corr_data).encode(
         x=alt.X('Variable 1', title=None),
@@ -132,7 +236,8 @@ def create_heatmap(corr_df):
         color=alt.value('black') 
     )
 
-    return (heatmap + text).interactive()
+    # 범주형 축이라 확대/이동이 의미가 없으므로 interactive()는 사용하지 않음
+    return heatmap + text
 
 
 # --- Streamlit 앱 본문 ---
@@ -158,10 +263,24 @@ st.markdown("**(Sex_numeric: 여성=1, 남성=0)**")
 st.dataframe(df_numeric.head())
 
 # 2. 상관관계 계산 및 히트맵 표시
-corr_matrix = calculate_correlation(df_numeric)
+# 버튼 클릭 시 재실행마다 DataFrame을 해싱하지 않도록 상관관계는 한 번만 계산하여
+# ndarray와 열 이름 튜플로 보관하고, 히트맵/산점도는 Vega-Lite 명세(JSON)로 한 번만 직렬화해 둠
+# (파일 이름이 아니라 로드된 데이터의 지문으로 구분하여, 같은 이름의 파일이 바뀌어도 다시 계산)
+data_key = df_numeric.attrs['data_key']
+if st.session_state.get('corr_data_key') != data_key:
+    corr_matrix = calculate_correlation(df_numeric)
+    st.session_state.corr = (corr_matrix.to_numpy(), tuple(corr_matrix.columns))
+    # 양/음 극단값 쌍은 한 번만 계산해 두고 두 버튼에서 재사용
+    st.session_state.extremes = {
+        is_positive: get_extreme_correlations(*st.session_state.corr, is_positive=is_positive)
+        for is_positive in (True, False)
+    }
+    st.session_state.heatmap_spec = create_heatmap(corr_matrix).to_dict()
+    st.session_state.scatter_specs = {}
+    st.session_state.corr_data_key = data_key
 
 st.subheader("🔥 상관관계 행렬 히트맵 (Correlation Heatmap)")
-st.altair_chart(create_heatmap(corr_matrix), use_container_width=True)
+st.vega_lite_chart(st.session_state.heatmap_spec, use_container_width=True)
 
 # 3. 극단적인 상관관계 탐색
 st.subheader("🔎 가장 강력한 상관관계 쌍")
@@ -172,14 +291,13 @@ col1, col2 = st.columns(2)
 with col1:
     st.markdown("### 🥇 가장 높은 양의 상관관계 (Positive Correlation)")
     if st.button("양의 상관관계 결과 보기", key="positive_corr"):
-        var1, var2, corr_value = get_extreme_correlations(corr_matrix, is_positive=True)
+        var1, var2, corr_value = st.session_state.extremes[True]
         
-        if corr_value:
+        if corr_value is not None:
             st.success(f"**{var1}**와 **{var2}**")
             st.code(f"상관계수 (R): {corr_value:.4f}")
             
-            chart = create_scatterplot(df_numeric, var1, var2, corr_value)
-            st.altair_chart(chart, use_container_width=True)
+            st.vega_lite_chart(get_scatterplot_spec(df_numeric, var1, var2, corr_value), use_container_width=True)
         else:
             st.info("양의 상관관계를 가진 쌍을 찾을 수 없습니다.")
 
@@ -187,14 +305,13 @@ with col1:
 with col2:
     st.markdown("### 📉 가장 높은 음의 상관관계 (Negative Correlation)")
     if st.button("음의 상관관계 결과 보기", key="negative_corr"):
-        var1, var2, corr_value = get_extreme_correlations(corr_matrix, is_positive=False)
+        var1, var2, corr_value = st.session_state.extremes[False]
         
-        if corr_value:
+        if corr_value is not None:
             st.error(f"**{var1}**와 **{var2}**")
             st.code(f"상관계수 (R): {corr_value:.4f}")
             
-            chart = create_scatterplot(df_numeric, var1, var2, corr_value)
-            st.altair_chart(chart, use_container_width=True)
+            st.vega_lite_chart(get_scatterplot_spec(df_numeric, var1, var2, corr_value), use_container_width=True)
         else:
             st.info("음의 상관관계를 가진 쌍을 찾을 수 없습니다.")
 